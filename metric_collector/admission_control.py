@@ -0,0 +1,72 @@
+import asyncio
+import math
+import time
+
+from fastapi import HTTPException, status
+
+
+def too_many_requests(detail, retry_after):
+    """429 response telling the client how many seconds to back off"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests for a route; extra requests wait up to queue_timeout.
+
+    Requests that are still waiting when the timeout expires are rejected with
+    429 so a burst queues briefly instead of exhausting the connection pool.
+    Must only be used from the event loop (async dependencies), so waiting
+    for a slot never ties up a threadpool worker.
+    """
+
+    def __init__(self, name, max_concurrency, queue_timeout, retry_after):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise too_many_requests(f"Server busy ({self.name}), retry later", self.retry_after)
+
+    def release(self):
+        self._semaphore.release()
+
+
+class RateLimiter:
+    """Token bucket per key: `rate` requests per second with bursts up to `burst`.
+
+    Buckets idle for longer than idle_ttl seconds are dropped once more than
+    max_keys keys are tracked. Must only be used from the event loop.
+    """
+
+    def __init__(self, rate, burst, idle_ttl=600, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, last refill time)
+
+    def check(self, key):
+        """Take one token for key or raise 429 with the time until one is available"""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            raise too_many_requests(f"Rate limit exceeded for {key}", (1 - tokens) / self.rate)
+
+        self._buckets[key] = (tokens - 1, now)
+        if len(self._buckets) > self.max_keys:
+            self._evict_idle(now)
+
+    def _evict_idle(self, now):
+        for key in [k for k, (_, last) in self._buckets.items() if now - last > self.idle_ttl]:
+            del self._buckets[key]
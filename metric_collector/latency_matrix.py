@@ -0,0 +1,225 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+# Light in fiber covers roughly 200 km per ms, so the best possible round
+# trip over a great-circle distance d (km) is d / 100 ms
+FIBER_KM_PER_MS_RTT = 100.0
+
+# A probe/target pair is flagged as an abnormal route when its RTT is more
+# than this many times the fiber minimum and at least ABNORMAL_MIN_EXCESS_MS
+# above it (the second condition keeps short, nearby paths from being flagged)
+ABNORMAL_ROUTE_FACTOR = 3.0
+ABNORMAL_MIN_EXCESS_MS = 30.0
+
+EARTH_RADIUS_KM = 6371.0
+
+# One row per (probe, node) pair in the window; the database does the
+# per-pair aggregation and NumPy does everything across pairs
+WINDOW_AGGREGATES_QUERY = '''
+    SELECT
+        pr.probe_name,
+        host(pr.ip_address) AS ip_address,
+        n.dc_id,
+        count(*) AS ping_count,
+        count(*) FILTER (WHERE pr.avg_rtt > 0) AS rtt_count,
+        COALESCE(avg(pr.avg_rtt) FILTER (WHERE pr.avg_rtt > 0), 0)::float8 AS avg_rtt,
+        avg(pr.packet_loss)::float8 AS avg_packet_loss
+    FROM ping_results pr
+    LEFT JOIN nodes n ON n.ip_address = pr.ip_address
+    WHERE pr.ping_at_datetime >= %s AND pr.ping_at_datetime < %s
+    GROUP BY pr.probe_name, pr.ip_address, n.dc_id
+'''
+
+DATA_CENTERS_QUERY = '''
+    SELECT dc_key, dc_name, latitude::float8, longitude::float8
+    FROM data_centers
+    ORDER BY dc_key
+'''
+
+
+def load_probe_locations(path):
+    """Map probe names (as written to ping_results.probe_name, lowercased) to (lat, long).
+
+    The file is a JSON object of {"PROBE_NAME": {"lat": ..., "long": ...}}.
+    """
+    with open(path) as f:
+        probes = json.load(f)
+
+    return {
+        name.strip().lower(): (float(coords["lat"]), float(coords["long"]))
+        for name, coords in probes.items()
+    }
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; arguments broadcast like NumPy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def fetch_window_data(conn, start, end):
+    """Fetch per-(probe, node) aggregates and data centers in two queries"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(WINDOW_AGGREGATES_QUERY, (start, end))
+        rows = cursor.fetchall()
+        cursor.execute(DATA_CENTERS_QUERY)
+        data_centers = cursor.fetchall()
+        return rows, data_centers
+    finally:
+        cursor.close()
+
+
+def _to_json_matrix(matrix):
+    """Convert a float matrix to nested lists with NaN as None"""
+    return np.where(np.isnan(matrix), None, np.round(matrix, 3)).tolist()
+
+
+def _route_stats(rtt, distance_km):
+    """Distance-normalized RTT and the abnormal-route mask for matching matrices"""
+    min_rtt = distance_km / FIBER_KM_PER_MS_RTT
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rtt_ratio = np.where(min_rtt > 0, rtt / min_rtt, np.nan)
+    abnormal = ((rtt_ratio > ABNORMAL_ROUTE_FACTOR)
+                & (rtt - min_rtt > ABNORMAL_MIN_EXCESS_MS))
+    return rtt_ratio, abnormal
+
+
+def build_latency_matrices(rows, data_centers, probe_locations):
+    """Build probe x data-center and probe x node latency/loss matrices.
+
+    rows are the WINDOW_AGGREGATES_QUERY results and data_centers the
+    DATA_CENTERS_QUERY results. Cells without pings are NaN (None in JSON).
+    Data-center cells are ping-weighted averages over the data center's nodes.
+    """
+    dc_keys = [dc[0] for dc in data_centers]
+    dc_index = {key: i for i, key in enumerate(dc_keys)}
+    dc_lat = np.array([np.nan if dc[2] is None else dc[2] for dc in data_centers], dtype=float)
+    dc_lon = np.array([np.nan if dc[3] is None else dc[3] for dc in data_centers], dtype=float)
+
+    if rows:
+        probe_col, ip_col, dc_col, ping_count, rtt_count, avg_rtt, avg_loss = zip(*rows)
+    else:
+        probe_col, ip_col, dc_col, ping_count, rtt_count, avg_rtt, avg_loss = ((),) * 7
+
+    probes, probe_idx = np.unique(np.array(probe_col, dtype=object).astype(str), return_inverse=True)
+    nodes, node_idx = np.unique(np.array(ip_col, dtype=object).astype(str), return_inverse=True)
+    dc_idx = np.array([dc_index.get(dc, -1) for dc in dc_col], dtype=np.int64)
+    ping_count = np.asarray(ping_count, dtype=float)
+    rtt_count = np.asarray(rtt_count, dtype=float)
+    avg_rtt = np.asarray(avg_rtt, dtype=float)
+    avg_loss = np.nan_to_num(np.asarray(avg_loss, dtype=float))
+
+    n_probes, n_nodes, n_dcs = len(probes), len(nodes), len(dc_keys)
+
+    probe_coords = np.array(
+        [probe_locations.get(p.strip().lower(), (np.nan, np.nan)) for p in probes],
+        dtype=float).reshape(n_probes, 2)
+    probe_lat, probe_lon = probe_coords[:, 0], probe_coords[:, 1]
+    unlocated = [p for p in probes if p.strip().lower() not in probe_locations]
+    if unlocated:
+        logging.warning(f"No coordinates for probes {unlocated}; their distance columns are empty")
+
+    # Probe x node: one aggregated row per cell, so plain fancy indexing
+    node_rtt = np.full((n_probes, n_nodes), np.nan)
+    node_loss = np.full((n_probes, n_nodes), np.nan)
+    node_pings = np.zeros((n_probes, n_nodes), dtype=np.int64)
+    has_rtt = rtt_count > 0
+    node_rtt[probe_idx[has_rtt], node_idx[has_rtt]] = avg_rtt[has_rtt]
+    node_loss[probe_idx, node_idx] = avg_loss
+    node_pings[probe_idx, node_idx] = ping_count.astype(np.int64)
+
+    node_dc = np.full(n_nodes, -1, dtype=np.int64)
+    node_dc[node_idx] = dc_idx
+    # Index -1 (node without a known data center) picks the trailing NaN
+    node_lat = np.append(dc_lat, np.nan)[node_dc]
+    node_lon = np.append(dc_lon, np.nan)[node_dc]
+    node_distance = haversine_km(probe_lat[:, None], probe_lon[:, None], node_lat[None, :], node_lon[None, :])
+    node_rtt_ratio, node_abnormal = _route_stats(node_rtt, node_distance)
+
+    # Probe x data center: weighted sums over nodes via bincount on flat cell ids
+    in_dc = dc_idx >= 0
+    cell = probe_idx[in_dc] * n_dcs + dc_idx[in_dc]
+    size = n_probes * n_dcs
+    rtt_weight = np.bincount(cell, weights=rtt_count[in_dc], minlength=size)
+    rtt_sum = np.bincount(cell, weights=(avg_rtt * rtt_count)[in_dc], minlength=size)
+    loss_weight = np.bincount(cell, weights=ping_count[in_dc], minlength=size)
+    loss_sum = np.bincount(cell, weights=(avg_loss * ping_count)[in_dc], minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dc_rtt = np.where(rtt_weight > 0, rtt_sum / rtt_weight, np.nan).reshape(n_probes, n_dcs)
+        dc_loss = np.where(loss_weight > 0, loss_sum / loss_weight, np.nan).reshape(n_probes, n_dcs)
+    dc_pings = loss_weight.astype(np.int64).reshape(n_probes, n_dcs)
+
+    dc_distance = haversine_km(probe_lat[:, None], probe_lon[:, None], dc_lat[None, :], dc_lon[None, :])
+    dc_rtt_ratio, dc_abnormal = _route_stats(dc_rtt, dc_distance)
+
+    return {
+        "probes": probes.tolist(),
+        "data_centers": {
+            "columns": dc_keys,
+            "avg_rtt": _to_json_matrix(dc_rtt),
+            "avg_packet_loss": _to_json_matrix(dc_loss),
+            "ping_count": dc_pings.tolist(),
+            "distance_km": _to_json_matrix(dc_distance),
+            "rtt_to_fiber_min_ratio": _to_json_matrix(dc_rtt_ratio),
+            "abnormal_route": dc_abnormal.tolist(),
+        },
+        "nodes": {
+            "columns": nodes.tolist(),
+            "data_center": [dc_keys[i] if i >= 0 else None for i in node_dc],
+            "avg_rtt": _to_json_matrix(node_rtt),
+            "avg_packet_loss": _to_json_matrix(node_loss),
+            "ping_count": node_pings.tolist(),
+            "distance_km": _to_json_matrix(node_distance),
+            "rtt_to_fiber_min_ratio": _to_json_matrix(node_rtt_ratio),
+            "abnormal_route": node_abnormal.tolist(),
+        },
+    }
+
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire ttl_seconds after being set.
+
+    At most max_entries are kept; the entry closest to expiry is evicted first.
+    """
+
+    def __init__(self, ttl_seconds, max_entries=8):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            # Evict everything that has expired, not just the requested key
+            for expired_key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[expired_key]
+            entry = self._entries.get(key)
+            return entry[1] if entry else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+
+def compute_latency_matrices(conn, window_hours, probe_locations):
+    """Fetch the last window_hours of pings and build the latency matrices"""
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(hours=window_hours)
+    rows, data_centers = fetch_window_data(conn, start, end)
+    result = build_latency_matrices(rows, data_centers, probe_locations)
+    result["window_start"] = start.isoformat()
+    result["window_end"] = end.isoformat()
+    return result
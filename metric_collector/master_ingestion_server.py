@@ -1,15 +1,16 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Depends, status
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal
 from jose import JWTError, jwt
+import anyio
 import psycopg2
 from psycopg2 import pool  # Connection pooling
 import os
 from datetime import datetime
 from fastapi.security import OAuth2PasswordBearer
-
-# FastAPI app initialization
-app = FastAPI()
+from admission_control import ConcurrencyLimiter, RateLimiter, too_many_requests
+from latency_matrix import TTLCache, compute_latency_matrices, load_probe_locations
 
 # JWT token configs: secret key and algorithm
 ENV = os.getenv("ENVIRONMENT", "dev")
@@ -28,11 +29,48 @@ DATABASE_USER = os.getenv("DATABASE_USER")
 DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD")
 DATABASE_PORT = os.getenv("DATABASE_PORT")
 
+# Adjust max connections according to your app's traffic and database capacity
+DB_POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "50"))
+
+# Admission control: how long a request may wait for a free slot, the
+# Retry-After sent when it cannot get one, and the per-probe request rate
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "10"))
+PROBE_RATE_LIMIT = float(os.getenv("PROBE_RATE_LIMIT", "10"))
+PROBE_RATE_BURST = int(os.getenv("PROBE_RATE_BURST", "50"))
+
+# Per-route concurrency; ingestion gets whatever the read routes leave of the
+# pool, so admitted requests always find a free connection
+NODES_MAX_CONCURRENCY = 5
+LATENCY_MATRIX_MAX_CONCURRENCY = 2
+ping_results_limiter = ConcurrencyLimiter(
+    "ping_results", max(1, DB_POOL_MAX_CONN - NODES_MAX_CONCURRENCY - LATENCY_MATRIX_MAX_CONCURRENCY),
+    ADMISSION_QUEUE_TIMEOUT, RETRY_AFTER_SECONDS)
+nodes_limiter = ConcurrencyLimiter(
+    "nodes", NODES_MAX_CONCURRENCY, ADMISSION_QUEUE_TIMEOUT, RETRY_AFTER_SECONDS)
+latency_matrix_limiter = ConcurrencyLimiter(
+    "latency_matrix", LATENCY_MATRIX_MAX_CONCURRENCY, ADMISSION_QUEUE_TIMEOUT, RETRY_AFTER_SECONDS)
+
+probe_rate_limiter = RateLimiter(PROBE_RATE_LIMIT, PROBE_RATE_BURST)
+
+# Handlers are plain `def` so psycopg2 calls run in FastAPI's threadpool.
+# Size the threadpool so every request admitted by the route limiters above
+# gets a thread instead of queueing again without a timeout
+
+
+@asynccontextmanager
+async def lifespan(app):
+    thread_limiter = anyio.to_thread.current_default_thread_limiter()
+    thread_limiter.total_tokens = max(thread_limiter.total_tokens, DB_POOL_MAX_CONN + 10)
+    yield
+
+# FastAPI app initialization
+app = FastAPI(lifespan=lifespan)
 
 # Initialize connection pool (this can be done when the app starts)
-db_pool = psycopg2.pool.SimpleConnectionPool(
+db_pool = psycopg2.pool.ThreadedConnectionPool(
     minconn=1,
-    maxconn=50,  # Adjust max connections according to your app's traffic and database capacity
+    maxconn=DB_POOL_MAX_CONN,
     dbname=DATABASE_NAME,
     user=DATABASE_USER,
     password=DATABASE_PASSWORD,
@@ -40,6 +78,22 @@ db_pool = psycopg2.pool.SimpleConnectionPool(
     port=DATABASE_PORT
 )
 
+# Probe coordinates (keyed by probe_name) used to distance-normalize RTTs
+# in the latency matrix
+PROBE_LOCATIONS_FILE = os.getenv("PROBE_LOCATIONS_FILE", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "probe_locations.json"))
+try:
+    probe_locations = load_probe_locations(PROBE_LOCATIONS_FILE)
+except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+    print(f'Could not load probe locations from {PROBE_LOCATIONS_FILE}: {e}')
+    probe_locations = {}
+
+# Latency matrices are only offered for these windows (hours) and cached per
+# window for LATENCY_MATRIX_CACHE_TTL seconds, so the cache stays bounded
+LATENCY_MATRIX_WINDOWS = (1, 6, 24, 168)
+latency_matrix_cache = TTLCache(
+    int(os.getenv("LATENCY_MATRIX_CACHE_TTL", "300")), max_entries=len(LATENCY_MATRIX_WINDOWS))
+
 # Get a connection from the pool
 
 
@@ -50,6 +104,9 @@ def get_db_connection():
             raise HTTPException(
                 status_code=500, detail="Database connection failed")
         return conn
+    except psycopg2.pool.PoolError:
+        # Pool exhausted: ask the client to back off instead of failing hard
+        raise too_many_requests("Database busy, retry later", RETRY_AFTER_SECONDS)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Database connection failed: {str(e)}")
@@ -82,6 +139,30 @@ def verify_token(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
+# Per-probe rate limit. Requests without a per-probe key are only bounded by
+# the route limiters: every probe shares the same `sub`, so keying on it would
+# put all probes into one bucket
+
+
+def check_probe_rate(probe_name):
+    if probe_name:
+        probe_rate_limiter.check(probe_name)
+
+# Admission control dependency: verifies the token, applies the per-probe
+# rate limit and then holds a concurrency slot for the route until the
+# request ends. Runs on the event loop, so waiting for a slot blocks nothing
+
+
+def admit(limiter):
+    async def dependency(payload: dict = Depends(verify_token)):
+        check_probe_rate(payload.get("probe_name"))
+        await limiter.acquire()
+        try:
+            yield payload
+        finally:
+            limiter.release()
+    return dependency
+
 # Structure of ping results
 
 
@@ -94,11 +175,25 @@ class PingResult(BaseModel):
     probe_name: str
     traceroute_data: str
 
+# Admission control for /ping_results/: older probe tokens carry no probe
+# name, so fall back to the probe_name of the posted results. The rate limit
+# is checked before a slot is taken so throttled requests never hold one
+
+
+async def admit_ping_results(ping_results: List[PingResult], payload: dict = Depends(verify_token)):
+    check_probe_rate(payload.get("probe_name")
+                     or (ping_results[0].probe_name if ping_results else None))
+    await ping_results_limiter.acquire()
+    try:
+        yield ping_results
+    finally:
+        ping_results_limiter.release()
+
 # Endpoint to get nodes from the database
 
 
 @app.get("/nodes/")
-async def get_nodes(token: str = Depends(verify_token)):
+def get_nodes(token: dict = Depends(admit(nodes_limiter))):
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -118,7 +213,7 @@ async def get_nodes(token: str = Depends(verify_token)):
 
 
 @app.post("/ping_results/")
-async def add_ping_results(ping_results: List[PingResult], token: str = Depends(verify_token)):
+def add_ping_results(ping_results: List[PingResult] = Depends(admit_ping_results)):
     conn = get_db_connection()
     cursor = conn.cursor()
 
@@ -156,3 +251,39 @@ async def add_ping_results(ping_results: List[PingResult], token: str = Depends(
     finally:
         cursor.close()
         release_db_connection(conn)
+
+# Endpoint to get the probe x data-center (or probe x node) latency matrix
+
+
+@app.get("/latency_matrix/")
+def get_latency_matrix(
+    window_hours: int = 24,
+    group_by: Literal["data_center", "node"] = "data_center",
+    token: dict = Depends(admit(latency_matrix_limiter)),
+):
+    if window_hours not in LATENCY_MATRIX_WINDOWS:
+        raise HTTPException(
+            status_code=422, detail=f"window_hours must be one of {list(LATENCY_MATRIX_WINDOWS)}")
+
+    matrices = latency_matrix_cache.get(window_hours)
+
+    if matrices is None:
+        conn = get_db_connection()
+
+        try:
+            matrices = compute_latency_matrices(conn, window_hours, probe_locations)
+            latency_matrix_cache.set(window_hours, matrices)
+
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        finally:
+            conn.rollback()
+            release_db_connection(conn)
+
+    return {
+        "window_start": matrices["window_start"],
+        "window_end": matrices["window_end"],
+        "probes": matrices["probes"],
+        "matrix": matrices["data_centers" if group_by == "data_center" else "nodes"],
+    }
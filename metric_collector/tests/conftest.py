@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The collector modules are imported by file name, as uvicorn does when run
+# from metric_collector/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,140 @@
+import asyncio
+import importlib
+import sys
+import threading
+import time
+
+import httpx
+import psycopg2.pool
+import pytest
+from jose import jwt
+
+QUERY_SECONDS = 0.3
+
+
+class FakeCursor:
+    def execute(self, query, params=None):
+        time.sleep(QUERY_SECONDS)
+
+    def executemany(self, query, params):
+        time.sleep(QUERY_SECONDS)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    """Stands in for ThreadedConnectionPool and records peak connections in use"""
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.in_use = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+        return FakeConnection()
+
+    def putconn(self, conn):
+        with self._lock:
+            self.in_use -= 1
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("JWT_SECRET_KEY", "test-secret")
+    monkeypatch.setenv("ALGORITHM", "HS256")
+    # 8 connections leave the ping_results route a single slot
+    monkeypatch.setenv("DB_POOL_MAX_CONN", "8")
+    monkeypatch.setenv("ADMISSION_QUEUE_TIMEOUT", "0.1")
+    monkeypatch.setenv("RETRY_AFTER_SECONDS", "7")
+    monkeypatch.setenv("PROBE_RATE_LIMIT", "1")
+    monkeypatch.setenv("PROBE_RATE_BURST", "2")
+    monkeypatch.setattr(psycopg2.pool, "ThreadedConnectionPool", FakePool)
+    sys.modules.pop("master_ingestion_server", None)
+    yield importlib.import_module("master_ingestion_server")
+    sys.modules.pop("master_ingestion_server", None)
+
+
+def auth_headers(**claims):
+    token = jwt.encode({"sub": "my_service", **claims}, "test-secret", algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def ping_results(probe_name):
+    return [{
+        "ip_address": "10.0.0.1",
+        "avg_rtt": 12.5,
+        "packets_sent": 4,
+        "packets_received": 4,
+        "packet_loss": 0.0,
+        "probe_name": probe_name,
+        "traceroute_data": "[]",
+    }]
+
+
+def send_concurrently(app, requests):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.request(method, url, **kwargs) for method, url, kwargs in requests))
+    return asyncio.run(run())
+
+
+def test_full_route_returns_429_with_retry_after(server):
+    responses = send_concurrently(server.app, [
+        ("POST", "/ping_results/", {"json": ping_results(f"PROBE_{i}"), "headers": auth_headers()})
+        for i in range(2)
+    ])
+
+    statuses = sorted(r.status_code for r in responses)
+    assert statuses == [200, 429]
+    throttled = next(r for r in responses if r.status_code == 429)
+    assert throttled.headers["Retry-After"] == "7"
+
+
+def test_queries_run_concurrently_off_the_event_loop(server):
+    start = time.monotonic()
+    responses = send_concurrently(server.app, [
+        ("GET", "/nodes/", {"headers": auth_headers(probe_name=f"PROBE_{i}")})
+        for i in range(5)
+    ])
+
+    assert [r.status_code for r in responses] == [200] * 5
+    assert server.db_pool.peak == 5
+    assert time.monotonic() - start < 5 * QUERY_SECONDS
+
+
+def test_rate_limit_is_per_probe(server):
+    headers = auth_headers(probe_name="PROBE_TORONTO")
+    responses = send_concurrently(server.app, [("GET", "/nodes/", {"headers": headers})] * 3)
+
+    statuses = sorted(r.status_code for r in responses)
+    assert statuses == [200, 200, 429]
+    assert int(next(r for r in responses if r.status_code == 429).headers["Retry-After"]) >= 1
+
+    # Another probe has its own bucket
+    other = send_concurrently(server.app, [("GET", "/nodes/", {"headers": auth_headers(probe_name="PROBE_SPAIN")})])
+    assert other[0].status_code == 200
+
+
+def test_tokens_without_probe_name_do_not_share_a_bucket(server):
+    responses = send_concurrently(server.app, [("GET", "/nodes/", {"headers": auth_headers()})] * 4)
+
+    assert [r.status_code for r in responses] == [200] * 4
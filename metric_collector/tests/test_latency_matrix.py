@@ -0,0 +1,58 @@
+import logging
+from pathlib import Path
+
+from latency_matrix import TTLCache, build_latency_matrices, load_probe_locations
+
+PROBE_LOCATIONS_FILE = Path(__file__).resolve().parent.parent / "probe_locations.json"
+
+# Ordered by dc_key, as DATA_CENTERS_QUERY returns them
+DATA_CENTERS = [
+    ("fr1", "Frankfurt", 50.11, 8.68),
+    ("to1", "Toronto", 43.65, -79.38),
+]
+
+
+def test_real_probe_names_have_coordinates():
+    locations = load_probe_locations(PROBE_LOCATIONS_FILE)
+    for probe_name in ("PROBE_TORONTO", "PROBE_SINGAPORE", "PROBE_SPAIN"):
+        assert probe_name.lower() in locations
+
+
+def test_matrices_normalize_rtt_for_real_probes():
+    locations = load_probe_locations(PROBE_LOCATIONS_FILE)
+    rows = [
+        ("PROBE_TORONTO", "10.0.0.1", "to1", 10, 10, 2.0, 0.0),
+        ("PROBE_TORONTO", "10.0.0.2", "fr1", 10, 10, 400.0, 0.0),
+        ("PROBE_SPAIN", "10.0.0.2", "fr1", 10, 10, 30.0, 10.0),
+    ]
+
+    result = build_latency_matrices(rows, DATA_CENTERS, locations)
+
+    assert result["probes"] == ["PROBE_SPAIN", "PROBE_TORONTO"]
+    dcs = result["data_centers"]
+    assert dcs["columns"] == ["fr1", "to1"]
+    assert dcs["avg_rtt"] == [[30.0, None], [400.0, 2.0]]
+    assert all(d is not None for row in dcs["distance_km"] for d in row)
+    # Toronto -> Frankfurt at 400 ms is far above the ~63 ms fiber minimum
+    assert dcs["abnormal_route"] == [[False, False], [True, False]]
+    assert result["nodes"]["abnormal_route"] == [[False, False], [False, True]]
+
+
+def test_probes_without_coordinates_are_logged(caplog):
+    rows = [("PROBE_UNKNOWN", "10.0.0.1", "to1", 10, 10, 2.0, 0.0)]
+
+    with caplog.at_level(logging.WARNING):
+        result = build_latency_matrices(rows, DATA_CENTERS, {})
+
+    assert "PROBE_UNKNOWN" in caplog.text
+    assert result["data_centers"]["distance_km"] == [[None, None]]
+
+
+def test_ttl_cache_is_bounded():
+    cache = TTLCache(ttl_seconds=60, max_entries=2)
+    for key in range(5):
+        cache.set(key, key)
+
+    assert cache.get(0) is None
+    assert cache.get(3) == 3
+    assert cache.get(4) == 4
@@ -1,5 +1,7 @@
 import os
 import json
+import time
+import random
 import logging
 import requests
 from datetime import datetime
@@ -55,6 +57,7 @@ if PROBE_NAME is None:
 def generate_token():
     payload = {
         "sub": "my_service",
+        "probe_name": PROBE_NAME,  # lets the server rate limit per probe
         "iat": datetime.utcnow().timestamp()
     }
     token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=ALGORITHM)
@@ -71,8 +74,27 @@ headers = {
 }
 
 
+# Retries after a 429 before giving up on a request
+MAX_RETRIES = 3
+
+# Send a request, waiting out the server's Retry-After on 429. The random
+# extra wait keeps probes that were throttled together from retrying together
+
+
+def request_with_backoff(method, url, **kwargs):
+    for attempt in range(MAX_RETRIES + 1):
+        response = requests.request(method, url, **kwargs)
+        if response.status_code != 429 or attempt == MAX_RETRIES:
+            return response
+        retry_after = int(response.headers.get("Retry-After", "10"))
+        logging.warning(
+            f"Server busy ({url}), retrying in {retry_after}s")
+        time.sleep(retry_after + random.uniform(0, retry_after))
+
+
 def get_nodes_from_api():
-    response = requests.get(f"{MASTER_INGESTION_URL}/nodes/", headers=headers)
+    response = request_with_backoff(
+        "GET", f"{MASTER_INGESTION_URL}/nodes/", headers=headers)
     if response.status_code == 200:
         data = response.json()
         nodes = data['nodes']
@@ -119,10 +141,10 @@ else:
 
             try:
                 # Send the ping result data to the API endpoint
-                response = requests.post(f"{MASTER_INGESTION_URL}/ping_results/",
-                                         headers=headers,
-                                         data=json.dumps([ping_result])
-                                         )
+                response = request_with_backoff("POST", f"{MASTER_INGESTION_URL}/ping_results/",
+                                                headers=headers,
+                                                data=json.dumps([ping_result])
+                                                )
 
                 # Check if the request was successful
                 if response.status_code == 200:
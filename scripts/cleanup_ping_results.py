@@ -4,6 +4,7 @@ import psycopg2
 import logging
 from dotenv import load_dotenv
 from pathlib import Path
+from export_state import get_state_file, load_last_exported_at
 
 # Get the environment name
 env = os.getenv("ENV", "default")
@@ -42,11 +43,41 @@ DATABASE_USER = os.getenv("DATABASE_USER")
 DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD")
 DATABASE_PORT = os.getenv("DATABASE_PORT")
 
-# Compute the timestamp for three months ago
-three_months_ago = (datetime.datetime.utcnow() - datetime.timedelta(days=90)).isoformat()
+# Export state written by export_ping_results.py, resolved the same way as
+# there (EXPORT_STATE_FILE, else EXPORT_DIR/_export_state.json). When present,
+# rows that have not been archived yet are never deleted
+EXPORT_STATE_FILE = get_state_file()
+
+# Compute the timestamp for three months ago (aware, so Postgres compares it
+# in UTC whatever the session TimeZone)
+three_months_ago = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=90)
+
+
+def get_delete_cutoff():
+    """Return the UTC timestamp below which rows may be deleted, or None to skip deletion"""
+    if not Path(EXPORT_STATE_FILE).exists():
+        if os.getenv("EXPORT_STATE_FILE") or os.getenv("EXPORT_DIR"):
+            logging.warning(f"Export state file {EXPORT_STATE_FILE} not found. Skipping deletion of unarchived rows.")
+            return None
+        # Export not configured and never run: plain 90-day retention
+        return three_months_ago
+
+    last_exported_at = load_last_exported_at(EXPORT_STATE_FILE)
+    if last_exported_at is None:
+        logging.warning(f"No export watermark in {EXPORT_STATE_FILE}. Skipping deletion of unarchived rows.")
+        return None
+
+    if last_exported_at < three_months_ago:
+        logging.warning(f"Export watermark {last_exported_at.isoformat()} is older than the retention cutoff; "
+                        f"only deleting rows that have been archived.")
+    return min(three_months_ago, last_exported_at)
 
 # Delete query
 def delete_old_entries():
+    cutoff = get_delete_cutoff()
+    if cutoff is None:
+        return
+
     try:
         # Connect to PostgreSQL
         connection = psycopg2.connect(
@@ -63,7 +94,7 @@ def delete_old_entries():
             DELETE FROM ping_results 
             WHERE ping_at_datetime < %s
         """
-        cursor.execute(delete_query, (three_months_ago,))
+        cursor.execute(delete_query, (cutoff,))
         
         # Commit and close
         connection.commit()
@@ -0,0 +1,274 @@
+import os
+import datetime
+import argparse
+import logging
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from pathlib import Path
+from export_state import (get_export_dir, get_state_file, parse_timestamp,
+                          load_last_exported_at, save_last_exported_at)
+
+# Get the environment name
+env = os.getenv("ENV", "default")
+
+# Set up script directory and log file
+script_dir = Path(__file__).resolve().parent
+log_file = script_dir / f"{env}.export_ping_results.log"
+env_file = script_dir / f".env.{env}"
+
+log_path = Path(log_file)
+if not log_path.exists():
+    log_path.touch()  # Create the file if it doesn't exist
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler(log_file),  # Logs to a file
+        logging.StreamHandler()          # Also log to console
+    ]
+)
+
+# Load the environment-specific .env file
+dotenv_path = Path(env_file)
+if dotenv_path.exists():
+    load_dotenv(dotenv_path)
+    logging.info(f"Loaded environment variables from {env_file}")
+else:
+    logging.warning(f"Environment file {env_file} not found. Falling back to default environment variables.")
+
+# Define database credentials based on environment
+DATABASE_NAME = os.getenv("DATABASE_NAME")
+DATABASE_HOST = os.getenv("DATABASE_HOST")
+DATABASE_USER = os.getenv("DATABASE_USER")
+DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD")
+DATABASE_PORT = os.getenv("DATABASE_PORT")
+
+# Export location and the state file used for incremental runs
+EXPORT_DIR = get_export_dir()
+EXPORT_STATE_FILE = get_state_file()
+
+# Rows pulled from the server-side cursor per round trip; bounds memory use
+BATCH_SIZE = 50000
+
+# Rows newer than this are left for the next run, so transactions that
+# stamped NOW() but have not committed yet are not skipped over
+SAFETY_LAG = datetime.timedelta(minutes=5)
+
+# Columns are cast server side so the Parquet schema does not depend on
+# psycopg2 type adapters (NUMERIC -> Decimal, JSONB -> dict, INET -> str)
+EXPORT_QUERY = """
+    SELECT
+        ping_at_datetime,
+        host(ip_address) AS ip_address,
+        probe_name,
+        avg_rtt::float8 AS avg_rtt,
+        packets_sent,
+        packets_received,
+        packet_loss::float8 AS packet_loss,
+        traceroute_data::text AS traceroute_data
+    FROM ping_results
+    WHERE ping_at_datetime > %s AND ping_at_datetime <= %s
+    ORDER BY ping_at_datetime
+"""
+
+NEXT_ROW_QUERY = """
+    SELECT min(ping_at_datetime)
+    FROM ping_results
+    WHERE ping_at_datetime > %s AND ping_at_datetime <= %s
+"""
+
+EXPORT_SCHEMA = pa.schema([
+    ("ping_at_datetime", pa.timestamp("us", tz="UTC")),
+    ("ip_address", pa.string()),
+    ("probe_name", pa.string()),
+    ("avg_rtt", pa.float64()),
+    ("packets_sent", pa.int32()),
+    ("packets_received", pa.int32()),
+    ("packet_loss", pa.float64()),
+    ("traceroute_data", pa.string()),
+])
+
+
+class DayPartitionWriter:
+    """Writes rows into one Parquet file per UTC day (export_dir/day=YYYY-MM-DD/).
+
+    Each file holds one exported range (range_start, range_end] and is named
+    after it, part-<range_start>-<range_end>.parquet. Files are written under a
+    temporary name and renamed once complete, so an interrupted run never
+    leaves a partial file behind. Re-exporting a range after a crash (file
+    renamed, watermark not yet saved) replaces the earlier file instead of
+    adding a duplicate, as does any earlier file starting at the same point.
+    """
+
+    def __init__(self, export_dir, compression="zstd"):
+        self.export_dir = Path(export_dir)
+        self.compression = compression
+        self.writer = None
+        self.tmp_path = None
+        self.final_path = None
+        self.range_tag = None
+        self.rows_in_file = 0
+
+    def open(self, day, range_start, range_end):
+        self.close()
+        partition_dir = self.export_dir / f"day={day.isoformat()}"
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        self.range_tag = _range_tag(range_start)
+        name = f"part-{self.range_tag}-{_range_tag(range_end)}.parquet"
+        self.final_path = partition_dir / name
+        self.tmp_path = partition_dir / f".{name}.tmp"
+        self.writer = pq.ParquetWriter(self.tmp_path, EXPORT_SCHEMA, compression=self.compression)
+        self.rows_in_file = 0
+
+    def write_batch(self, columns):
+        table = pa.Table.from_pydict(columns, schema=EXPORT_SCHEMA)
+        self.writer.write_table(table)
+        self.rows_in_file += table.num_rows
+
+    def close(self):
+        """Finish the current file; returns True if a file was completed"""
+        if self.writer is None:
+            return False
+        self.writer.close()
+        os.replace(self.tmp_path, self.final_path)
+        # An earlier attempt from the same start covers a subset of this range
+        for stale in self.final_path.parent.glob(f"part-{self.range_tag}-*.parquet"):
+            if stale != self.final_path:
+                stale.unlink()
+        logging.info(f"Wrote {self.rows_in_file} rows to {self.final_path}")
+        self.writer = None
+        return True
+
+    def abort(self):
+        """Drop the current day's unfinished file"""
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.tmp_path.unlink(missing_ok=True)
+        self.writer = None
+
+
+def _range_tag(ts):
+    """Compact, sortable UTC form of a range bound for file names"""
+    return ts.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def rows_to_columns(rows):
+    """Transpose a list of row tuples into a dict of column lists"""
+    return dict(zip(EXPORT_SCHEMA.names, (list(column) for column in zip(*rows))))
+
+
+def export_ping_results(start, end, export_dir, state_file, batch_size=BATCH_SIZE):
+    """Stream ping_results in (start, end] to day-partitioned Parquet files.
+
+    Each UTC day is read in its own short read-only transaction through a
+    named (server-side) cursor, so only batch_size rows are held in memory and
+    no snapshot stays open across days (which would hold back vacuum). When
+    state_file is given it is advanced after each completed day, so a failed
+    run resumes from the last finished file.
+    """
+    writer = DayPartitionWriter(export_dir)
+    connection = None
+    total_rows = 0
+
+    try:
+        connection = psycopg2.connect(
+            dbname=DATABASE_NAME,
+            user=DATABASE_USER,
+            password=DATABASE_PASSWORD,
+            host=DATABASE_HOST,
+            port=DATABASE_PORT
+        )
+        # A read-only transaction keeps the export off the write path
+        connection.set_session(readonly=True)
+        with connection.cursor() as setup_cursor:
+            setup_cursor.execute("SET TIME ZONE 'UTC'")
+        connection.commit()
+
+        day_start = start
+        while day_start < end:
+            # Jump straight to the next day that has rows, skipping gaps
+            with connection.cursor() as cursor:
+                cursor.execute(NEXT_ROW_QUERY, (day_start, end))
+                next_row_at = cursor.fetchone()[0]
+            connection.commit()
+            if next_row_at is None:
+                break
+
+            # Upper bound is the last microsecond of that UTC day
+            day = next_row_at.astimezone(datetime.timezone.utc).date()
+            next_midnight = datetime.datetime.combine(
+                day + datetime.timedelta(days=1), datetime.time(), datetime.timezone.utc)
+            day_end = min(end, next_midnight - datetime.timedelta(microseconds=1))
+
+            writer.open(day, day_start, day_end)
+            cursor = connection.cursor(name="export_ping_results")
+            cursor.itersize = batch_size
+            cursor.execute(EXPORT_QUERY, (day_start, day_end))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                writer.write_batch(rows_to_columns(rows))
+                total_rows += len(rows)
+            cursor.close()
+            connection.commit()
+
+            writer.close()
+            if state_file:
+                save_last_exported_at(state_file, day_end)
+            logging.info(f"Exported {total_rows} rows so far (up to {day_end.isoformat()})")
+            day_start = day_end
+
+        if state_file:
+            # Every row up to the end of the window has been written
+            save_last_exported_at(state_file, end)
+        logging.info(f"Export finished: {total_rows} rows in ({start.isoformat()}, {end.isoformat()}]")
+        return total_rows
+    except Exception as e:
+        writer.abort()
+        logging.error(f"Error exporting ping results: {e}")
+        raise
+    finally:
+        if connection:
+            connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export ping_results to day-partitioned Parquet files")
+    parser.add_argument("--start", help="Exclusive lower bound (ISO timestamp). Defaults to the last exported timestamp.")
+    parser.add_argument("--end", help="Inclusive upper bound (ISO timestamp). Defaults to now minus a safety lag.")
+    parser.add_argument("--export-dir", default=EXPORT_DIR, help="Directory that receives the day=YYYY-MM-DD partitions")
+    parser.add_argument("--state-file", default=EXPORT_STATE_FILE, help="JSON file tracking the last exported timestamp")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows fetched per round trip")
+    args = parser.parse_args()
+
+    state_file = args.state_file
+    if args.start:
+        # Explicit ranges are one-off backfills and leave the incremental state alone
+        start = parse_timestamp(args.start)
+        state_file = None
+    else:
+        start = load_last_exported_at(args.state_file)
+        if start is None:
+            start = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+            logging.info("No export state found, exporting from the beginning")
+
+    if args.end:
+        end = parse_timestamp(args.end)
+    else:
+        end = datetime.datetime.now(datetime.timezone.utc) - SAFETY_LAG
+
+    if end <= start:
+        logging.info(f"Nothing to export: {start.isoformat()} is not before {end.isoformat()}")
+        return
+
+    export_ping_results(start, end, args.export_dir, state_file, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
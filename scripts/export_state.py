@@ -0,0 +1,49 @@
+import os
+import json
+import datetime
+from pathlib import Path
+
+# Shared by export_ping_results.py and cleanup_ping_results.py so both agree
+# on where the export watermark lives. Paths are resolved at call time, after
+# each script has loaded its .env file
+
+script_dir = Path(__file__).resolve().parent
+
+
+def get_export_dir():
+    """Directory that receives the day=YYYY-MM-DD partitions"""
+    return os.getenv("EXPORT_DIR", str(script_dir / "exports" / "ping_results"))
+
+
+def get_state_file():
+    """JSON file holding the last exported timestamp"""
+    return os.getenv("EXPORT_STATE_FILE", str(Path(get_export_dir()) / "_export_state.json"))
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp, treating naive values as UTC"""
+    ts = datetime.datetime.fromisoformat(value)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return ts
+
+
+def load_last_exported_at(state_file):
+    """Return the timestamp of the last exported row, or None on a first run"""
+    state_path = Path(state_file)
+    if not state_path.exists():
+        return None
+    with open(state_path) as f:
+        state = json.load(f)
+    last_exported_at = state.get("last_exported_at")
+    return parse_timestamp(last_exported_at) if last_exported_at else None
+
+
+def save_last_exported_at(state_file, last_exported_at):
+    """Atomically persist the timestamp of the last exported row"""
+    state_path = Path(state_file)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"last_exported_at": last_exported_at.isoformat()}, f)
+    os.replace(tmp_path, state_path)
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+# The scripts are imported by file name, as they are run from scripts/.
+# ENV picks the log file name they create on import
+os.environ.setdefault("ENV", "test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
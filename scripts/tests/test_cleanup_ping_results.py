@@ -0,0 +1,65 @@
+import datetime
+import json
+
+import pytest
+
+import cleanup_ping_results
+
+UTC = datetime.timezone.utc
+
+
+@pytest.fixture
+def state_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXPORT_STATE_FILE", raising=False)
+    monkeypatch.delenv("EXPORT_DIR", raising=False)
+    path = tmp_path / "_export_state.json"
+    monkeypatch.setattr(cleanup_ping_results, "EXPORT_STATE_FILE", str(path))
+    return path
+
+
+def write_watermark(path, value):
+    path.write_text(json.dumps({"last_exported_at": value}))
+
+
+def test_no_state_file_uses_plain_retention(state_file):
+    cutoff = cleanup_ping_results.get_delete_cutoff()
+
+    assert cutoff == cleanup_ping_results.three_months_ago
+    assert cutoff.utcoffset() == datetime.timedelta(0)
+
+
+def test_missing_state_file_skips_deletion_when_export_is_configured(state_file, monkeypatch):
+    monkeypatch.setenv("EXPORT_DIR", str(state_file.parent))
+
+    assert cleanup_ping_results.get_delete_cutoff() is None
+
+
+def test_state_file_without_watermark_skips_deletion(state_file):
+    state_file.write_text("{}")
+
+    assert cleanup_ping_results.get_delete_cutoff() is None
+
+
+def test_recent_watermark_keeps_plain_retention(state_file):
+    write_watermark(state_file, datetime.datetime.now(UTC).isoformat())
+
+    assert cleanup_ping_results.get_delete_cutoff() == cleanup_ping_results.three_months_ago
+
+
+def test_old_watermark_limits_deletion(state_file):
+    watermark = cleanup_ping_results.three_months_ago - datetime.timedelta(days=10)
+    write_watermark(state_file, watermark.isoformat())
+
+    assert cleanup_ping_results.get_delete_cutoff() == watermark
+
+
+def test_watermark_with_offset_is_compared_as_an_instant(state_file):
+    old = cleanup_ping_results.three_months_ago - datetime.timedelta(days=10)
+    toronto = datetime.timezone(datetime.timedelta(hours=-5))
+    write_watermark(state_file, old.astimezone(toronto).isoformat())
+
+    cutoff = cleanup_ping_results.get_delete_cutoff()
+
+    # Aware value, so Postgres does not reinterpret it in the session TimeZone
+    assert cutoff.tzinfo is not None
+    assert cutoff == old
@@ -0,0 +1,156 @@
+import datetime
+
+import pyarrow.parquet as pq
+import pytest
+
+import export_ping_results
+
+UTC = datetime.timezone.utc
+
+
+def ts(*args):
+    return datetime.datetime(*args, tzinfo=UTC)
+
+
+def row(at):
+    return (at, "10.0.0.1", "PROBE_TORONTO", 12.5, 4, 4, 0.0, "[]")
+
+
+def test_writer_renames_file_into_place_only_on_close(tmp_path):
+    writer = export_ping_results.DayPartitionWriter(tmp_path)
+    day = datetime.date(2026, 1, 1)
+    writer.open(day, ts(2025, 12, 31, 23, 59), ts(2026, 1, 1, 23, 59))
+    writer.write_batch(export_ping_results.rows_to_columns([row(ts(2026, 1, 1, 10))]))
+
+    partition = tmp_path / "day=2026-01-01"
+    assert list(partition.glob("part-*.parquet")) == []
+
+    assert writer.close()
+    files = list(partition.glob("part-*.parquet"))
+    assert len(files) == 1
+    assert pq.read_table(files[0]).num_rows == 1
+    assert list(partition.glob(".*.tmp")) == []
+
+
+def test_writer_abort_leaves_no_file(tmp_path):
+    writer = export_ping_results.DayPartitionWriter(tmp_path)
+    writer.open(datetime.date(2026, 1, 1), ts(2026, 1, 1), ts(2026, 1, 1, 12))
+    writer.write_batch(export_ping_results.rows_to_columns([row(ts(2026, 1, 1, 10))]))
+
+    writer.abort()
+
+    assert list((tmp_path / "day=2026-01-01").iterdir()) == []
+
+
+def test_reexporting_a_range_replaces_the_earlier_file(tmp_path):
+    writer = export_ping_results.DayPartitionWriter(tmp_path)
+    day = datetime.date(2026, 1, 1)
+    # A crashed run got as far as noon; the retry covers the whole day
+    for range_end in (ts(2026, 1, 1, 12), ts(2026, 1, 1, 23, 59)):
+        writer.open(day, ts(2026, 1, 1), range_end)
+        writer.write_batch(export_ping_results.rows_to_columns([row(ts(2026, 1, 1, 10))]))
+        writer.close()
+
+    files = list((tmp_path / "day=2026-01-01").glob("part-*.parquet"))
+    assert len(files) == 1
+    assert "20260101T235900" in files[0].name
+
+
+ROWS = [
+    row(ts(2026, 1, 1, 23, 50)),
+    row(ts(2026, 1, 2, 0, 0)),  # exactly midnight belongs to the next day
+    row(ts(2026, 1, 2, 12, 0)),
+    row(ts(2026, 1, 5, 8, 0)),  # after a three day gap
+]
+
+
+class FakeCursor:
+    def __init__(self, queries):
+        self.queries = queries
+        self.rows = []
+
+    def execute(self, query, params=None):
+        if params is None:
+            return
+        low, high = params
+        self.queries.append((query, low, high))
+        self.rows = [r for r in ROWS if low < r[0] <= high]
+
+    def fetchone(self):
+        return (min((r[0] for r in self.rows), default=None),)
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+        self.commits = 0
+
+    def set_session(self, **kwargs):
+        pass
+
+    def cursor(self, name=None):
+        return FakeCursor(self.queries)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(export_ping_results.psycopg2, "connect", lambda **kwargs: connection)
+    return connection
+
+
+def test_export_runs_one_window_per_day(tmp_path, fake_db, monkeypatch):
+    saved = []
+    monkeypatch.setattr(export_ping_results, "save_last_exported_at",
+                        lambda state_file, value: saved.append(value))
+    start, end = ts(2025, 12, 1), ts(2026, 1, 6)
+
+    total = export_ping_results.export_ping_results(start, end, tmp_path, "state.json", batch_size=1)
+
+    assert total == len(ROWS)
+    windows = [(low, high) for query, low, high in fake_db.queries
+               if query == export_ping_results.EXPORT_QUERY]
+    last_microsecond = datetime.timedelta(microseconds=1)
+    assert windows == [
+        (start, ts(2026, 1, 2) - last_microsecond),
+        (ts(2026, 1, 2) - last_microsecond, ts(2026, 1, 3) - last_microsecond),
+        # The empty days in between are skipped
+        (ts(2026, 1, 3) - last_microsecond, ts(2026, 1, 6) - last_microsecond),
+    ]
+    # Watermark advances after each day, then to the end of the window
+    assert saved == [high for _, high in windows] + [end]
+
+    rows_per_day = {
+        path.parent.name: pq.read_table(path).num_rows
+        for path in tmp_path.glob("day=*/part-*.parquet")
+    }
+    assert rows_per_day == {"day=2026-01-01": 1, "day=2026-01-02": 2, "day=2026-01-05": 1}
+
+
+def test_explicit_range_leaves_state_alone(tmp_path, fake_db, monkeypatch):
+    saved = []
+    monkeypatch.setattr(export_ping_results, "save_last_exported_at",
+                        lambda state_file, value: saved.append(value))
+
+    export_ping_results.export_ping_results(ts(2026, 1, 1), ts(2026, 1, 3), tmp_path, None)
+
+    assert saved == []